@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Times the alternative parsing engines and parser features on phrases of
+increasing length. The correctness checks live in check.py.
+"""
+
+import time
+import random
+
+from earley import *
+from earley.kbest import KBest
+
+def timeit(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+def crossover(chains=(0, 1, 2, 4, 8, 12, 16, 24)):
+    earley   = get_default_parser()
+    matrix   = MatrixParser(earley.grammar, earley.lexicon)
+    compiled = CompiledParser(earley.grammar, earley.lexicon)
+
+    print "%8s %12s %12s %12s" % ("length", "earley (s)", "matrix (s)", "compiled (s)")
+    for chain in chains:
+        # An ambiguous chain of prepositional phrases: the ball of the house ...
+        phrase = " ".join(["the ball"] + ["of the house"] * chain)
+        print "%8i %12.4f %12.4f %12.4f" % (len(phrase.split()), timeit(earley.parse, phrase),
+            timeit(matrix.parse, phrase), timeit(compiled.parse, phrase))
+
+def overhead(chain=8, repeats=20):
+    """
+    Times parsing with no limits against generous limits that are checked
+    but never reached, then shows the partial progress of a tripped limit.
+    """
+    parser = get_default_parser()
+    phrase = " ".join(["the ball"] + ["of the house"] * chain)
+    limits = {"max_items": 10**9, "max_entry_items": 10**9, "timeout": 3600, "max_bytes": 2**40}
+
+    unlimited = min(timeit(parser.parse, phrase) for idx in xrange(repeats))
+    limited   = min(timeit(lambda: parser.parse(phrase, **limits)) for idx in xrange(repeats))
+    print "Limit checks: %.4fs unlimited, %.4fs limited (%+.1f%%)" % (
+        unlimited, limited, 100.0 * (limited - unlimited) / unlimited)
+
+    try:
+        parser.parse(phrase, max_items=500)
+    except ParseLimitError as e:
+        print "%s (%s)" % (e, e.counts)
+
+def edits(chain=8, seed=42):
+    """
+    Replays edit traces with full parses and with reparse. Typing appends
+    one word at a time; the substitution trace swaps random words of the
+    finished phrase.
+    """
+    rng    = random.Random(seed)
+    parser = get_default_parser()
+    tokens = " ".join(["the ball"] + ["of the house"] * chain).split(" ")
+    nouns  = ["ball", "house", "airport", "runway", "bunny"]
+
+    typing = [tokens[:idx] for idx in xrange(1, len(tokens)+1)]
+    swaps  = []
+    for idx in xrange(len(tokens)):
+        edited = list(swaps[-1] if swaps else tokens)
+        jdx = rng.choice([kdx for kdx, token in enumerate(tokens) if token in nouns])
+        edited[jdx] = rng.choice(nouns)
+        swaps.append(edited)
+
+    for name, trace in (("typing", typing), ("substitution", swaps)):
+        start = time.time()
+        for edit in trace:
+            parser.parse(" ".join(edit))
+        full = time.time() - start
+
+        start   = time.time()
+        results = [parser.parse(" ".join(trace[0]))]
+        for edit in trace[1:]:
+            results.append(parser.reparse(results[-1], edit))
+        incremental = time.time() - start
+
+        print "%s trace of %i edits: %.4fs full, %.4fs incremental" % (
+            name, len(trace), full, incremental)
+
+def ranking(chains=(2, 4, 6, 8, 10), ks=(1, 10, 100)):
+    """
+    Times extracting the k best parses of ever more ambiguous phrases.
+    """
+    parser = get_default_parser()
+
+    print "%8s %14s" % ("length", "parses") + "".join("%12s" % ("k=%i (s)" % k) for k in ks)
+    for chain in chains:
+        phrase = " ".join(["the ball"] + ["of the house"] * chain)
+        result = parser.parse(phrase)
+        times  = [timeit(lambda: list(KBest(result).parses(k))) for k in ks]
+        print "%8i %14i" % (len(phrase.split()), KBest(result).count()) + "".join("%12.4f" % t for t in times)
+
+if __name__ == "__main__":
+    crossover()
+    overhead()
+    edits()
+    ranking()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+
+"""
+Checks the alternative parsing engines and parser features against the
+EarleyParser on the shipped grammar and on random grammars. The timings
+live in bench.py.
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import threading
+
+from earley import *
+from earley.kbest import KBest, rules
+
+def random_grammar(rng, nonterms=6, preterms=4, rules=14, maxlen=3):
+    """
+    Builds a random grammar over S0..Sn with S0 renamed to NP, the start
+    symbol, and a lexicon with one word per preterminal.
+    """
+    symbols = ["NP"] + ["S%i" % idx for idx in xrange(1, nonterms)]
+    tags    = ["T%i" % idx for idx in xrange(preterms)]
+    grammar = Grammar()
+
+    for lhs in symbols:
+        grammar[lhs] = Production(lhs, (rng.choice(tags),))
+    for tag in tags:
+        lhs = rng.choice(symbols)
+        grammar[lhs] = Production(lhs, (tag,))
+    for idx in xrange(rules):
+        lhs = rng.choice(symbols)
+        rhs = tuple(rng.choice(symbols + tags) for jdx in xrange(rng.randint(1, maxlen)))
+        grammar[lhs] = Production(lhs, rhs)
+
+    lexicon = Lexicon(**dict(("w%i" % idx, tag) for idx, tag in enumerate(tags)))
+    return grammar, lexicon
+
+def random_phrases(rng, words, count, maxlen):
+    return [" ".join(rng.choice(words) for jdx in xrange(rng.randint(1, maxlen)))
+            for idx in xrange(count)]
+
+def trials(trials=200, seed=42):
+    """
+    Yields (grammar, lexicon, phrases) for the shipped grammar, then for
+    random grammars.
+    """
+    rng    = random.Random(seed)
+    parser = get_default_parser()
+    yield parser.grammar, parser.lexicon, random_phrases(rng, parser.lexicon.words(), trials, 6)
+
+    for idx in xrange(trials):
+        grammar, lexicon = random_grammar(rng)
+        yield grammar, lexicon, random_phrases(rng, lexicon.words(), 5, 8)
+
+def chart_items(grammar, column):
+    """
+    The items of an EarleyParser chart column that the other engines track:
+    grammar productions only, without the dummy and scanned word states.
+    """
+    return set((state.subtree.lhs, state.subtree.rhs, state.progress, state.position[0])
+               for state in column if state.subtree.lhs in grammar)
+
+def check_matrix():
+    """
+    Checks that the MatrixParser builds the same chart items and accepts the
+    same phrases as the EarleyParser.
+    """
+    for grammar, lexicon, phrases in trials():
+        earley = EarleyParser(grammar, lexicon)
+        matrix = MatrixParser(grammar, lexicon)
+        for phrase in phrases:
+            result = earley.parse(phrase)
+            mchart, accepted = matrix.parse(phrase)
+
+            assert accepted == (len(result.parses) > 0), phrase
+            for idx, column in enumerate(result.chart):
+                mitems = set((p.lhs, p.rhs, d, j) for p, d, j in matrix.states(mchart, idx))
+                assert chart_items(grammar, column) == mitems, (phrase, idx)
+
+    print "MatrixParser agrees with the EarleyParser."
+
+def check_threads(workers=8, phrases=50, seed=42):
+    """
+    Parses the same phrases on one shared parser from many threads and
+    compares the charts with parsing them one at a time.
+    """
+    parser   = get_default_parser()
+    phrases  = random_phrases(random.Random(seed), parser.lexicon.words(), phrases, 8)
+    expected = [str(parser.parse(phrase)) for phrase in phrases]
+    failures = []
+
+    def worker():
+        for phrase, chart in zip(phrases, expected):
+            if str(parser.parse(phrase)) != chart:
+                failures.append(phrase)
+
+    threads = [threading.Thread(target=worker) for idx in xrange(workers)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    assert not failures, failures
+    print "A shared parser agrees across %i threads." % workers
+
+def check_limits(chain=8):
+    """
+    Trips each resource limit and checks the partial progress it reports.
+    """
+    parser = get_default_parser()
+    phrase = " ".join(["the ball"] + ["of the house"] * chain)
+    full   = parser.parse(phrase)
+    total  = sum(len(entry) for entry in full.chart)
+
+    generous = {"max_items": total, "max_entry_items": 10**9, "timeout": 3600, "max_bytes": 2**40}
+    assert str(parser.parse(phrase, **generous)) == str(full)
+
+    for limit, limits in (("items", {"max_items": 500}),
+                          ("entry items", {"max_entry_items": 30}),
+                          ("bytes", {"max_bytes": 20000}),
+                          ("timeout", {"timeout": 0})):
+        try:
+            parser.parse(phrase, **limits)
+        except ParseLimitError as e:
+            assert e.limit == limit, (e.limit, limit)
+            assert e.column == len(e.result.chart) - 1
+            assert 0 < e.column <= len(full.words)
+            assert e.counts == [len(entry) for entry in e.result.chart]
+            assert e.items == sum(e.counts) < total
+            if limit == "items":
+                assert e.items == 501
+            if limit == "entry items":
+                assert max(e.counts) == 31
+            if limit == "bytes":
+                assert e.bytes == sum(sys.getsizeof(s) for entry in e.result.chart for s in entry) > 20000
+            else:
+                assert e.bytes is None
+        else:
+            raise AssertionError("The %s limit was not tripped" % limit)
+
+    print "Resource limits report their partial progress."
+
+def check_reparse(seed=42):
+    """
+    Checks that reparsing edits, including edits of results cut off by a
+    limit, gives the same chart as parsing the edited phrase.
+    """
+    rng    = random.Random(seed)
+    parser = get_default_parser()
+    nouns  = ["ball", "house", "airport", "runway", "bunny"]
+    tokens = " ".join(["the ball"] + ["of the house"] * 4).split(" ")
+
+    result = parser.parse(tokens[0])
+    for idx in xrange(2, len(tokens)+1):
+        result = parser.reparse(result, tokens[:idx])
+        assert str(result) == str(parser.parse(" ".join(tokens[:idx]))), tokens[:idx]
+
+    for idx in xrange(20):
+        edited = list(tokens)
+        edited[rng.choice([jdx for jdx, token in enumerate(tokens) if token in nouns])] = rng.choice(nouns)
+        edited = edited[:rng.randint(1, len(edited))]
+        assert str(parser.reparse(result, edited)) == str(parser.parse(" ".join(edited))), edited
+
+    # Tokens are normalized like the words of a string.
+    edited = ["The", "Ball,"] + tokens[2:]
+    assert str(parser.reparse(result, edited)) == str(parser.parse(" ".join(edited))), edited
+    assert parser.reparse(result, edited).chart[1] is result.chart[1]  # the prefix is reused
+
+    phrase = " ".join(tokens)
+    for limit in (5, 30, 100, 200):
+        try:
+            parser.parse(phrase, max_items=limit)
+        except ParseLimitError as e:
+            assert str(parser.reparse(e.result, phrase)) == str(parser.parse(phrase)), limit
+
+    print "Reparsing edits agrees with parsing them."
+
+def render(tree):
+    return "[%s]" % ", ".join(render(node) if isinstance(node, list) else str(node) for node in tree)
+
+def check_compiled():
+    """
+    Checks that the CompiledParser builds the same charts and trees as the
+    EarleyParser, reparses alike, and that its cache only loads source
+    generated for the same grammar.
+    """
+    for grammar, lexicon, phrases in trials():
+        earley   = EarleyParser(grammar, lexicon)
+        compiled = CompiledParser(grammar, lexicon)
+        for phrase in phrases:
+            result, cresult = earley.parse(phrase), compiled.parse(phrase)
+            assert str(result) == str(cresult), phrase
+            assert (sorted(render(state.tree) for state in result.parses) ==
+                    sorted(render(state.tree) for state in cresult.parses)), phrase
+
+        tokens = phrases[0].split(" ")
+        assert str(compiled.reparse(cresult, tokens)) == str(earley.parse(phrases[0]))
+
+    earley = get_default_parser()
+    phrase = "the ball of the house of the airport"
+    cache  = tempfile.mkdtemp()
+    try:
+        # Concurrent parsers for the same grammar share the cache file.
+        threads = [threading.Thread(target=CompiledParser, args=(earley.grammar, earley.lexicon, cache))
+                   for idx in xrange(8)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        compiled = CompiledParser(earley.grammar, earley.lexicon, cache)
+        assert os.listdir(cache) == [os.path.basename(compiled.path)]
+
+        # A cached file whose header does not match is regenerated.
+        with open(compiled.path, 'wb') as module:
+            module.write("# -*- coding: utf-8 -*-\n# tampered\nraise Exception\n")
+        compiled = CompiledParser(earley.grammar, earley.lexicon, cache)
+        assert str(compiled.parse(phrase)) == str(earley.parse(phrase))
+    finally:
+        shutil.rmtree(cache)
+
+    print "CompiledParser agrees with the EarleyParser."
+
+def check_ranked(result, limit=500):
+    """
+    Enumerates every parse with k-best and checks that they come in score
+    order, are distinct, score their number of nodes, include the first
+    derivation of every parse, and match the count of derivations.
+    """
+    ranker = KBest(result)
+    try:
+        total = ranker.count()
+    except ParseError:
+        return  # Unit cycles in a random grammar
+    if total > limit: return
+
+    ranked = list(ranker.parses(total + 1))
+    trees  = [render(tree) for score, tree in ranked]
+    scores = [score for score, tree in ranked]
+
+    assert len(ranked) == total, (total, len(ranked))
+    assert scores == sorted(scores)
+    assert len(set(trees)) == len(trees)
+    for score, tree in zip(scores, trees):
+        assert score == tree.count("\xe2\x97\x8f"), (score, tree)  # one dot per node
+    for state in result.parses:
+        assert render(state.tree) in trees
+
+def check_kbest():
+    """
+    Checks k-best extraction on EarleyParser and CompiledParser results.
+    """
+    for grammar, lexicon, phrases in trials():
+        earley   = EarleyParser(grammar, lexicon)
+        compiled = CompiledParser(grammar, lexicon)
+        for phrase in phrases:
+            check_ranked(earley.parse(phrase))
+            check_ranked(compiled.parse(phrase))
+
+    def flatten(tree):
+        for node in tree:
+            if isinstance(node, list):
+                for child in flatten(node): yield child
+            else:
+                yield node
+
+    # Rule weights are summed over the nodes of every tree.
+    weight = rules({"NP -> NP PP": 10, "NP -> Det NP": 3})
+    result = get_default_parser().parse("the ball of the house of the airport")
+    ranked = list(kbest_parses(result, 5, weight))
+    assert len(ranked) == 5
+    assert [score for score, tree in ranked] == sorted(score for score, tree in ranked)
+    for score, tree in ranked:
+        assert score == sum(weight(node) for node in flatten(tree))
+
+    print "k-best parses come in score order."
+
+if __name__ == "__main__":
+    check_matrix()
+    check_threads()
+    check_limits()
+    check_reparse()
+    check_compiled()
+    check_kbest()
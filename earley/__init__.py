@@ -1 +1,4 @@
 from earley import *
+from matrix import MatrixParser
+from codegen import CompiledParser
+from kbest import kbest_parses
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+# nlp.homework2.codegen
+
+"""
+Compiles a Grammar into Python source with one predict, scan or complete
+function per symbol and constant tables of productions and item numbers,
+so the parse loop dispatches on an integer instead of interpreting the
+grammar for every state. The generated source is executed when a
+CompiledParser is created, and may be cached on disk keyed by a hash of
+the grammar.
+"""
+
+import os
+import hashlib
+import tempfile
+
+from earley import EarleyParser, ParseResult, DottedRule
+from grammar import Production
+
+VERSION = "3"  # Bump when the generated source changes
+
+class CompiledRule(DottedRule):
+    """
+    A DottedRule that also carries the number of its compiled item, the
+    index into the generated ACTIONS table.
+    """
+
+    def __init__(self, subtree, progress, position, item):
+        DottedRule.__init__(self, subtree, progress, position)
+        self.item = item
+
+class CompiledResult(ParseResult):
+    """
+    A ParseResult that dedupes states with a set per chart entry of their
+    item, progress and origin, which is equivalent to comparing them with
+    every state in the entry. Sets are built the first time an entry is
+    appended to, so reused entries of a reparse cost nothing.
+    """
+
+    def __init__(self, words, chart, **limits):
+        ParseResult.__init__(self, words, chart, **limits)
+        self.keys = {}
+
+    def append(self, idx, state):
+        self.tick()
+        if len(self.chart) == idx:
+            self.chart.append([])
+
+        entry = self.chart[idx]
+        keys  = self.keys.get(idx)
+        if keys is None:
+            keys = self.keys[idx] = set((s.item, s.progress, s.position[0]) for s in entry)
+
+        key = (state.item, state.progress, state.position[0])
+        if key in keys: return
+
+        keys.add(key)
+        entry.append(state)
+        self.check(entry, state)
+
+class CodeGenerator(object):
+    """
+    Writes the Python source of a parse loop specialized to a grammar.
+    Items are the dotted rules of the dummy start production and of every
+    grammar production, numbered so that moving the dot one symbol right
+    adds one to the item, followed by one item per scanned preterminal.
+    """
+
+    def __init__(self, grammar, lexicon, start="NP"):
+        self.grammar = grammar
+        self.lexicon = lexicon
+        self.start   = start
+
+        # Repeated productions give equal states, so they share one item.
+        self.productions = [Production("⟐", (start,))]
+        for production in grammar.productions():
+            if self.production(production) is None:
+                self.productions.append(production)
+
+        self.items = []     # (production index, dot) for every item
+        for pdx, production in enumerate(self.productions):
+            for dot in xrange(len(production.rhs) + 1):
+                self.items.append((pdx, dot))
+
+        # Every symbol that can be predicted, scanned or completed.
+        symbols = set(self.lexicon.preterminals())
+        for production in self.productions:
+            symbols.add(production.lhs)
+            symbols.update(production.rhs)
+        self.symbols = sorted(symbols)
+
+        self.scanned = {}   # preterminal -> item of its scanned word states
+        for tag in self.symbols:
+            if tag not in grammar and tag != self.productions[0].lhs:
+                self.scanned[tag] = len(self.items) + len(self.scanned)
+
+    @property
+    def signature(self):
+        """
+        A hash of everything the generated source depends on.
+        """
+        digest = hashlib.sha1(VERSION)
+        digest.update(repr(self.symbols))
+        for production in self.productions:
+            digest.update(repr((production.lhs, production.rhs)))
+        return digest.hexdigest()
+
+    def item(self, pdx, dot):
+        return self.items.index((pdx, dot))
+
+    @property
+    def header(self):
+        """
+        The line after the coding line of the generated source, which names
+        the signature it was generated for.
+        """
+        return "# Generated by earley.codegen for grammar %s, do not edit." % self.signature
+
+    def generate(self):
+        """
+        Returns the generated source as a string.
+        """
+        lines = [
+            "# -*- coding: utf-8 -*-",
+            self.header,
+            "",
+        ]
+
+        for pdx, production in enumerate(self.productions):
+            lines.append("P%i = Production(%r, %r)" % (pdx, production.lhs, production.rhs))
+        lines.append("")
+
+        actions = []
+        for pdx, dot in self.items:
+            rhs = self.productions[pdx].rhs
+            if dot == len(rhs):
+                actions.append("complete_%i" % self.symbols.index(self.productions[pdx].lhs))
+            elif rhs[dot] in self.grammar:
+                actions.append("predict_%i" % self.symbols.index(rhs[dot]))
+            else:
+                actions.append("scan_%i" % self.symbols.index(rhs[dot]))
+        for tag in sorted(self.scanned, key=self.scanned.get):
+            actions.append("complete_%i" % self.symbols.index(tag))
+
+        for sdx, symbol in enumerate(self.symbols):
+            if symbol in self.grammar:
+                lines.extend(self.predictor(sdx, symbol))
+            elif symbol in self.scanned:
+                lines.extend(self.scanner(sdx, symbol))
+            lines.extend(self.completer(sdx, symbol))
+
+        lines.append("ACTIONS = (%s,)" % ", ".join(actions))
+        lines.append("SCANS = frozenset(%r)" % (tuple(idx for idx, action in enumerate(actions)
+                                                       if action.startswith("scan_")),))
+        lines.append("")
+        lines.extend([
+            "def process(result, start):",
+            "    chart = result.chart",
+            "    for idx in xrange(start, len(result.words)+1):",
+            "        if len(chart) == idx: break",
+            "        for state in chart[idx]:",
+            "            ACTIONS[state.item](result, state)",
+            "        result.finished = idx",
+            "    return result",
+            "",
+            "def scan_entry(result, idx):",
+            "    for state in result.chart[idx]:",
+            "        if state.item in SCANS:",
+            "            ACTIONS[state.item](result, state)",
+            "",
+        ])
+        return "\n".join(lines)
+
+    def predictor(self, sdx, symbol):
+        lines = [
+            "def predict_%i(result, state):" % sdx,
+            "    # %s" % symbol,
+            "    idx = state.position[1]",
+            "    append = result.append",
+        ]
+        predicted = []
+        for rule in self.grammar[symbol]:
+            pdx = self.production(rule)
+            if pdx in predicted: continue
+            predicted.append(pdx)
+            lines.append("    append(idx, CompiledRule(P%i, 0, [idx, idx], %i))" % (pdx, self.item(pdx, 0)))
+        lines.append("")
+        return lines
+
+    def scanner(self, sdx, symbol):
+        return [
+            "def scan_%i(result, state):" % sdx,
+            "    # %s" % symbol,
+            "    idx = state.position[1]",
+            "    words = result.words",
+            "    if len(words) == idx: return",
+            "    if words[idx][1] == %r:" % symbol,
+            "        result.append(idx+1, CompiledRule(Production(%r, (words[idx][0],)), "
+                "state.progress+1, [idx, idx+1], %i))" % (symbol, self.scanned[symbol]),
+            "",
+        ]
+
+    def completer(self, sdx, symbol):
+        waits = [idx for idx, (pdx, dot) in enumerate(self.items)
+                 if dot < len(self.productions[pdx].rhs) and self.productions[pdx].rhs[dot] == symbol]
+
+        if not waits:
+            return [
+                "def complete_%i(result, state):" % sdx,
+                "    # %s, nothing waits on it" % symbol,
+                "    pass",
+                "",
+            ]
+
+        return [
+            "WAITS_%i = frozenset(%r)" % (sdx, tuple(waits)),
+            "",
+            "def complete_%i(result, state):" % sdx,
+            "    # %s" % symbol,
+            "    kdx = state.position[1]",
+            "    append = result.append",
+            "    for cstate in result.chart[state.position[0]]:",
+            "        if cstate.item in WAITS_%i:" % sdx,
+            "            newstate = CompiledRule(cstate.subtree, cstate.progress+1, "
+                "[cstate.position[0], kdx], cstate.item+1)",
+            "            newstate.previous = cstate.previous + [state]",
+            "            append(kdx, newstate)",
+            "",
+        ]
+
+    def production(self, rule):
+        """
+        Index of the production with the same lhs and rhs as the rule, or
+        None (Productions compare equal on their lhs alone).
+        """
+        for pdx, production in enumerate(self.productions):
+            if (production.lhs, production.rhs) == (rule.lhs, rule.rhs):
+                return pdx
+        return None
+
+class CompiledParser(EarleyParser):
+    """
+    An EarleyParser whose parse loop is generated for its grammar. Results
+    are identical to those of the EarleyParser.
+
+    The source is generated in memory unless a cache directory is given. In
+    that case it is read from the directory if it was already written for an
+    identical grammar (checked against the signature in its header), and
+    otherwise generated and written there.
+    """
+
+    def __init__(self, grammar, lexicon, cachedir=None):
+        EarleyParser.__init__(self, grammar, lexicon)
+
+        generator = CodeGenerator(grammar, lexicon)
+        self.path = "<grammar %s>" % generator.signature
+        source    = None
+
+        if cachedir is not None:
+            self.path = os.path.join(cachedir, "grammar_%s.py" % generator.signature)
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as module:
+                    source = module.read()
+                if source.split("\n")[1:2] != [generator.header]:
+                    source = None
+
+        if source is None:
+            source = generator.generate()
+            if cachedir is not None:
+                self.write(cachedir, source)
+
+        self.module = {"CompiledRule": CompiledRule, "Production": Production}
+        exec compile(source, self.path, "exec") in self.module
+
+    def write(self, cachedir, source):
+        """
+        Writes the source to a unique temporary file in the cache directory,
+        then renames it into place so concurrent parsers never read half a
+        file.
+        """
+        if not os.path.exists(cachedir):
+            try:
+                os.makedirs(cachedir)
+            except OSError:
+                if not os.path.isdir(cachedir): raise
+
+        fd, path = tempfile.mkstemp(dir=cachedir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as module:
+            module.write(source)
+        os.rename(path, self.path)
+
+    @property
+    def dummy_state(self):
+        return CompiledRule(self.module["P0"], 0, [0, 0], 0)
+
+    def enqueue(self, words, chart=None, **limits):
+        return CompiledResult(words, chart or [[self.dummy_state,],], **limits)
+
+    def process(self, result, start):
+        return self.module["process"](result, start)
+
+    def scan_entry(self, result, idx):
+        self.module["scan_entry"](result, idx)
@@ -12,6 +12,9 @@
 Implementation of the Earely algorithm. 
 """
 
+import sys
+import time
+
 from utils import unpunct
 from lexicon import Lexicon, LexicalError
 from grammar import Grammar, GrammarError, Production
@@ -36,6 +39,26 @@ class ParseError(Exception):
     """
     pass
 
+class ParseLimitError(ParseError):
+    """
+    Raised when a parse exceeds one of its resource limits. Carries the
+    partial result along with the furthest column reached and item counts,
+    and the bytes of the chart if they were measured (otherwise None).
+    """
+
+    def __init__(self, limit, result):
+        self.limit  = limit
+        self.result = result
+
+        self.column  = len(result.chart) - 1
+        self.items   = result.items
+        self.counts  = [len(entry) for entry in result.chart]
+        self.bytes   = result.bytes
+        self.elapsed = time.time() - result.started
+
+        ParseError.__init__(self, "Exceeded the %s limit at chart entry %i with %i states" %
+                            (limit, self.column, self.items))
+
 class DottedRule(object):
     """
     A data structure representing a state in Earley parsing.
@@ -69,6 +92,13 @@ class DottedRule(object):
             return False
         return True
 
+    def scanned(self):
+        """
+        Returns True if the state was created by the scanner for a word: it
+        spans one word and was not advanced by the completer.
+        """
+        return not self.previous and self.position[0] < self.position[1]
+
     def nextcat(self):
         """
         Returns the next part of the subtree, after the progress.
@@ -82,18 +112,17 @@ class DottedRule(object):
         """
         Returns a tree of the previous nodes connected to this rule.
         """
-        def expandtree(tree):
-            for idx, node in enumerate(tree):
-                if isinstance(node, list):
-                    expandtree(node)
-                    continue
-
+        def expandtree(nodes):
+            # Builds new lists rather than inserting into node.previous, so
+            # that reading a tree never modifies the chart.
+            tree = []
+            for node in nodes:
+                tree.append(node)
                 if node.previous:
-                    tree.insert(idx+1, node.previous)
+                    tree.append(expandtree(node.previous))
+            return tree
 
-        tree = [self,]
-        expandtree(tree)
-        return tree
+        return expandtree([self,])
 
     def __eq__(self, other):
         return (self.subtree.lhs == other.subtree.lhs and 
@@ -101,20 +130,129 @@ class DottedRule(object):
                 self.progress == other.progress and
                 self.position == other.position)
 
+    def __sizeof__(self):
+        """
+        Approximate bytes held by this state, excluding the states it points
+        to. Predicted and completed states share their production with the
+        grammar or the state they advance, but scanned states own theirs.
+        """
+        size = (object.__sizeof__(self) + sys.getsizeof(self.__dict__) +
+                sys.getsizeof(self.position) + sys.getsizeof(self.previous))
+        if self.scanned():
+            size += (sys.getsizeof(self.subtree) + sys.getsizeof(self.subtree.__dict__) +
+                     sys.getsizeof(self.subtree.rhs))
+        return size
+
     def __str__(self):
         rhs = list(self.subtree.rhs)
         rhs[self.progress:self.progress] = ["●"]
         return "%s ⟶  %s, [%i, %i]" % (self.subtree.lhs, " ".join(rhs), self.position[0], self.position[1])
 
+class ParseResult(object):
+    """
+    The chart and words of a single call to EarleyParser.parse. All of the
+    per-call state lives here, so one parser can be shared between threads.
+
+    The optional limits bound the total number of states, the states in any
+    one chart entry, the seconds spent and the approximate bytes of the
+    chart; exceeding any of them raises a ParseLimitError. Limits that are
+    None are not checked, and bytes are only measured (otherwise None) when
+    max_bytes is given.
+    """
+
+    # The deadline is only checked every so many attempted appends
+    CLOCK_INTERVAL = 64
+
+    def __init__(self, words, chart, max_items=None, max_entry_items=None,
+                 timeout=None, max_bytes=None):
+        self.words = words
+        self.chart = chart
+
+        self.max_items       = max_items
+        self.max_entry_items = max_entry_items
+        self.max_bytes       = max_bytes
+
+        self.started  = time.time()
+        self.deadline = self.started + timeout if timeout is not None else None
+        self.items    = sum(len(entry) for entry in chart)
+        self.attempts = 0
+        self.finished = -1      # The last chart entry process completed
+        self.bytes    = None
+        if max_bytes is not None:
+            self.bytes = sum(sys.getsizeof(state) for entry in chart for state in entry)
+
+    def append(self, idx, state):
+        """
+        Adds the state to chart entry idx if it is not already there, then
+        checks the limits.
+        """
+        self.tick()
+        if len(self.chart) == idx:
+            self.chart.append([])
+
+        entry = self.chart[idx]
+        if state in entry: return
+
+        entry.append(state)
+        self.check(entry, state)
+
+    def check(self, entry, state):
+        """
+        Counts a state just added to the chart entry against the limits.
+        """
+        self.items += 1
+
+        if self.max_items is not None and self.items > self.max_items:
+            raise ParseLimitError("items", self)
+        if self.max_entry_items is not None and len(entry) > self.max_entry_items:
+            raise ParseLimitError("entry items", self)
+        if self.max_bytes is not None:
+            self.bytes += sys.getsizeof(state)
+            if self.bytes > self.max_bytes:
+                raise ParseLimitError("bytes", self)
+
+    def tick(self):
+        """
+        Counts an attempted append, duplicates included, and checks the
+        deadline every CLOCK_INTERVAL attempts.
+        """
+        self.attempts += 1
+        if self.deadline is not None and not self.attempts % self.CLOCK_INTERVAL:
+            if time.time() > self.deadline:
+                raise ParseLimitError("timeout", self)
+
+    @property
+    def parses(self):
+        """
+        Looks through the chart to find any successful parses.
+        """
+        parses = set()
+        if self.chart and self.words:
+            for entry in self.chart:
+                for state in entry:
+                    if state.finalized(len(self.words)):
+                        parses.add(state)
+        return parses
+
+    def __str__(self):
+        outstr = []
+        if self.chart:
+            for idx, states in enumerate(self.chart):
+                outstr.append("Chart Entry %i:  %s" % (idx, str(states[0])))
+                for state in states[1:]:
+                    outstr.append("                %s" % state)
+        return "\n".join(outstr)
+
 class EarleyParser(object):
+    """
+    Binds a Grammar and Lexicon for parsing. The parser is never modified
+    by parse, which returns a new ParseResult on every call.
+    """
     
     def __init__(self, grammar, lexicon):
         self.grammar = grammar
         self.lexicon = lexicon
 
-        self.chart   = None
-        self.words   = ""
-
         self.validate()
 
     @property
@@ -128,17 +266,6 @@ class EarleyParser(object):
 
         return DottedRule(gam, dot, pos)
 
-    @property
-    def parses(self):
-        """
-        Looks through the chart to find any successful parses.
-        """
-        if self.chart and self.words:
-            for entry in self.chart:
-                for state in entry:
-                    if state.finalized(len(self.words)):
-                        yield state
-
     def validate(self):
         """
         Checks to make sure all the symbols in the Lexicon are contained 
@@ -157,99 +284,140 @@ class EarleyParser(object):
         then splits on space. returns a list of all the words, along with 
         the part of speech tag from the lexicon. 
         """
-        string = string.lower()
-        string = unpunct(string)
-        tokens = string.split(" ")
-        tokens = [(token, self.lexicon[token]) for token in tokens]
-        return tokens
+        return self.tag(self.normalize(string).split(" "))
+
+    def normalize(self, string):
+        """
+        Lowercases the string and removes its punctuation, the same for a
+        whole phrase or for a single token.
+        """
+        return unpunct(string.lower())
+
+    def tag(self, tokens):
+        """
+        Pairs each token with its part of speech tag from the lexicon.
+        """
+        return [(token, self.lexicon[token]) for token in tokens]
 
-    def enqueue(self):
+    def enqueue(self, words, chart=None, **limits):
         """
-        Resets the chart to the start state.
+        Returns a new result for the words with the chart at the start state,
+        or continuing the entries of a previous chart.
         """
-        return [[self.dummy_state,],]
+        return ParseResult(words, chart or [[self.dummy_state,],], **limits)
 
-    def parse(self, string):
+    def parse(self, string, **limits):
         """
-        Initiates the parsing of a string and returns the result.
+        Initiates the parsing of a string and returns the result. Resource
+        limits for this call may be passed as keyword arguments, see the
+        ParseResult for the available limits.
         """
-        self.words = self.tokenize(string)
-        self.chart = self.enqueue()
+        result = self.enqueue(self.tokenize(string), **limits)
+        return self.process(result, 0)
 
-        print "Parsing the sequence:\n%s" % self.words
-        
-        for idx in xrange(0, len(self.words)+1):
-            if len(self.chart) == idx: break
-            for state in self.chart[idx]:
+    def reparse(self, previous, tokens, **limits):
+        """
+        Parses an edit of a previously parsed phrase, given as a string or
+        as a list of tokens, which are normalized like the words of a string.
+        Chart entries 0..k only depend on the first k words, so the entries
+        of the previous result up to the first changed word are reused and
+        only the rest of the chart is recomputed.
+        """
+        if isinstance(tokens, basestring):
+            words = self.tokenize(tokens)
+        else:
+            words = self.tag([self.normalize(token) for token in tokens])
+
+        # Only entries that process completed can be reused; a result cut
+        # off by a limit may hold half built entries after those.
+        if previous.finished < 0:
+            return self.process(self.enqueue(words, **limits), 0)
+
+        kdx   = 0
+        limit = min(len(words), len(previous.words), previous.finished)
+        while kdx < limit and words[kdx] == previous.words[kdx]:
+            kdx += 1
+
+        # Reused entries are shared, not copied: states are never modified
+        # and new states only go into entries after kdx.
+        result = self.enqueue(words, previous.chart[:kdx+1], **limits)
+        result.finished = kdx
+        self.scan_entry(result, kdx)
+
+        return self.process(result, kdx+1)
+
+    def scan_entry(self, result, idx):
+        """
+        Runs the scanner over the states of a finished chart entry, building
+        the next entry again for changed words.
+        """
+        for state in result.chart[idx]:
+            if state.incomplete() and state.nextcat() not in self.grammar:
+                self.scanner(result, state)
+
+    def process(self, result, start):
+        """
+        Runs the Earley loop over the chart entries from start onward.
+        """
+        for idx in xrange(start, len(result.words)+1):
+            if len(result.chart) == idx: break
+            for state in result.chart[idx]:
                 #print state
                 if state.incomplete():
                     #print "INCOMPLETE"
                     if state.nextcat() in self.grammar:
                         #print "PREDICTING"
-                        self.predictor(state)
+                        self.predictor(result, state)
                     else:
                         #print "SCANNING"
-                        self.scanner(state)
+                        self.scanner(result, state)
                 else:
                     #print "COMPLETING"
-                    self.completer(state)
+                    self.completer(result, state)
+            result.finished = idx
 
-        return self.chart, set(list(self.parses))
+        return result
 
-    def predictor(self, state):
+    def predictor(self, result, state):
         """
         Implements the Earley Predictor
         """
         idx = state.position[1]
         for rule in self.grammar[state.nextcat()]:
-            newtree  = Production(state.nextcat(), rule.rhs)
-            newstate = DottedRule(newtree, 0, [idx, idx])
+            newstate = DottedRule(rule, 0, [idx, idx])   # rule.lhs is nextcat
 
-            if newstate not in self.chart[idx]:
-                self.chart[idx].append(newstate)
+            result.append(idx, newstate)
 
-    def scanner(self, state):
+    def scanner(self, result, state):
         """
         Implements the Earley Scanner
         """
         idx = state.position[1]
 
-        if len(self.words) == idx: return # Make sure we're not trying to scan past the last word
+        if len(result.words) == idx: return # Make sure we're not trying to scan past the last word
 
-        if state.nextcat() == self.words[idx][1]:
-            newtree  = Production(state.nextcat(), (self.words[idx][0],))
+        if state.nextcat() == result.words[idx][1]:
+            newtree  = Production(state.nextcat(), (result.words[idx][0],))
             newpos   = [idx, idx + 1]
             newstate = DottedRule(newtree, state.progress+1, newpos)
 
-            if len(self.chart) < idx + 2:
-                self.chart.append([])
-            if newstate not in self.chart[idx+1]:
-                self.chart[idx+1].append(newstate)
+            result.append(idx+1, newstate)
 
-    def completer(self, state):
+    def completer(self, result, state):
         """
         Implements the Earley Completer
         """
         jdx = state.position[0]
         kdx = state.position[1]
 
-        for cstate in self.chart[jdx]:
+        for cstate in result.chart[jdx]:
             if cstate.nextcat() == state.subtree.lhs:
+                # Advance a copy: cstate may still be completed by another
+                # state ending in a different column.
                 idx = cstate.position[0]
-                cstate.position = [idx, kdx]
-                cstate.progress += 1
-                cstate.previous.append(state)
-                if cstate not in self.chart[kdx]:
-                    self.chart[kdx].append(cstate)
-
-    def __str__(self):
-        outstr = []
-        if self.chart:
-            for idx, states in enumerate(self.chart):
-                outstr.append("Chart Entry %i:  %s" % (idx, str(states[0])))
-                for state in states[1:]:
-                    outstr.append("                %s" % state)
-        return "\n".join(outstr)
+                newstate = DottedRule(cstate.subtree, cstate.progress+1, [idx, kdx])
+                newstate.previous = cstate.previous + [state]
+                result.append(kdx, newstate)
 
 if __name__ == "__main__":
 
@@ -259,9 +427,11 @@ if __name__ == "__main__":
         #test = "The beautiful bunnies."
         test = "An airport."
 
-        chart, parses = parser.parse(test)
+        result = parser.parse(test)
+        parses = result.parses
 
-        print parser
+        print "Parsing the sequence:\n%s" % result.words
+        print result
         print
 
         print len(parses)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# nlp.homework2.kbest
+
+"""
+Extracts the k best parse trees from a ParseResult in score order, after
+Huang and Chiang's lazy k-best algorithm (Better k-best Parsing, 2005).
+
+The chart only keeps the first derivation of every state in its previous
+list, so the derivations of a state are recovered from the chart instead:
+a state A -> α X ● β over [i, k] is derived from any completed X over
+[j, k] together with the state A -> α ● X β over [i, j]. Derivations of a
+state are only found and ranked when a tree that uses it is requested, so
+the work done grows with k rather than with the number of parses.
+
+The score of a tree is the sum of a weight function over its nodes, lower
+is better. The default weight counts nodes, ranking the smallest trees
+first; rules builds a weight function from rule weights.
+"""
+
+import heapq
+
+from itertools import count
+from earley import ParseError
+
+def nodes(state):
+    """
+    Weighs every node of a tree as 1, preferring the fewest nodes.
+    """
+    return 1
+
+def rules(weights, default=1):
+    """
+    Returns a weight function that looks up the weight of the production of
+    a node by its repr, e.g. {"NP -> NP PP": 2}, or returns the default.
+    """
+    def weight(state):
+        return weights.get(repr(state.subtree), default)
+    return weight
+
+def kbest_parses(result, k, weight=nodes):
+    """
+    Yields up to k (score, tree) pairs of the result in score order.
+    """
+    return KBest(result, weight).parses(k)
+
+class KBest(object):
+    """
+    Lazily ranks the derivations of the states in a ParseResult's chart.
+    Each state keeps the derivations found so far, best first, and a heap
+    of candidates for the next one. A derivation is a tuple of its score,
+    a tie breaker, the index of the edge it uses and the rank of the
+    derivation used for every state on that edge.
+    """
+
+    ROOT = object() # Joins the finalized states of the chart
+
+    def __init__(self, result, weight=nodes):
+        self.result = result
+        self.weight = weight
+
+        self.ties       = count()
+        self.indices    = {}    # column -> (incomplete states, completed states)
+        self.edges      = {}    # state -> list of tuples of states deriving it
+        self.derivs     = {}    # state -> derivations found so far
+        self.candidates = {}    # state -> heap of candidate derivations
+        self.seen       = {}    # state -> (edge, ranks) already pushed
+        self.active     = set() # states whose candidates are being built
+
+    def parses(self, k):
+        """
+        Yields up to k (score, tree) pairs in score order, where trees have
+        the same form as DottedRule.tree.
+        """
+        for rank in xrange(k):
+            if not self.kth(self.ROOT, rank + 1): return
+            derivation = self.derivs[self.ROOT][rank]
+            yield derivation[0], self.expand(self.children(self.ROOT, derivation))
+
+    def count(self, state=ROOT, counts=None):
+        """
+        Returns the total number of derivations of the state, by default the
+        number of parses, without enumerating them.
+        """
+        counts = {} if counts is None else counts
+        if state not in counts:
+            if state is not self.ROOT and not state.previous:
+                counts[state] = 1
+            else:
+                counts[state] = None
+                total = 0
+                for edge in self.derive(state):
+                    product = 1
+                    for tail in edge:
+                        product *= self.count(tail, counts)
+                    total += product
+                counts[state] = total
+
+        if counts[state] is None:
+            raise ParseError("Cannot count the parses of a grammar with unit cycles.")
+        return counts[state]
+
+    def index(self, idx):
+        """
+        Indexes chart entry idx by item and by completed lhs.
+        """
+        if idx not in self.indices:
+            incomplete = {}
+            completed  = {}
+            for state in self.result.chart[idx]:
+                subtree = state.subtree
+                if state.incomplete():
+                    incomplete[(subtree.lhs, subtree.rhs, state.progress, state.position[0])] = state
+                else:
+                    # Scanned states of the same word differ only in their
+                    # progress, they are a single node of the tree.
+                    states = completed.setdefault(subtree.lhs, {})
+                    states.setdefault((subtree.rhs, state.position[0]), state)
+            self.indices[idx] = (incomplete, dict((lhs, states.values()) for lhs, states in completed.items()))
+        return self.indices[idx]
+
+    def derive(self, state):
+        """
+        Returns the edges that derive the state, as tuples of states. States
+        without previous states are scanned words or predictions, which are
+        derived by nothing.
+        """
+        if state not in self.edges:
+            edges = []
+            if state is self.ROOT:
+                length = len(self.result.words)
+                if len(self.result.chart) > length:
+                    for final in self.index(length)[1].get("NP", []):
+                        if final.finalized(length):
+                            edges.append((final,))
+            elif state.previous:
+                lhs, rhs = state.subtree.lhs, state.subtree.rhs
+                idx, kdx = state.position
+                for child in self.index(kdx)[1].get(rhs[state.progress-1], []):
+                    jdx  = child.position[0]
+                    left = self.index(jdx)[0].get((lhs, rhs, state.progress-1, idx))
+                    if left is not None:
+                        edges.append((left, child))
+            self.edges[state] = edges
+        return self.edges[state]
+
+    def score(self, state, edge, ranks):
+        score = sum(self.derivs[tail][rank][0] for tail, rank in zip(edge, ranks))
+        if state is not self.ROOT and not state.incomplete():
+            score += self.weight(state)
+        return score
+
+    def kth(self, state, k):
+        """
+        Finds the k best derivations of the state, returning False if it has
+        fewer than k.
+        """
+        if state not in self.candidates:
+            if state in self.active:
+                raise ParseError("Cannot rank the parses of a grammar with unit cycles.")
+            self.active.add(state)
+
+            self.derivs[state] = []
+            edges = self.derive(state)
+            heap  = []
+            seen  = set()
+            if state is not self.ROOT and not state.previous:
+                heap.append((self.score(state, (), ()), next(self.ties), None, ()))
+            for edx, edge in enumerate(edges):
+                ranks = (0,) * len(edge)
+                if all(self.kth(tail, 1) for tail in edge):
+                    heap.append((self.score(state, edge, ranks), next(self.ties), edx, ranks))
+                    seen.add((edx, ranks))
+            heapq.heapify(heap)
+
+            self.active.remove(state)
+            self.candidates[state] = heap
+            self.seen[state] = seen
+
+        derivs = self.derivs[state]
+        heap   = self.candidates[state]
+        while len(derivs) < k:
+            if derivs:
+                self.successors(state, derivs[-1])
+            if not heap: break
+            derivs.append(heapq.heappop(heap))
+        return len(derivs) >= k
+
+    def successors(self, state, derivation):
+        """
+        Pushes the neighbours of the derivation, each using the next best
+        derivation of one of the states on its edge.
+        """
+        edx, ranks = derivation[2], derivation[3]
+        if edx is None: return
+
+        edge = self.edges[state][edx]
+        for tdx, tail in enumerate(edge):
+            successor = ranks[:tdx] + (ranks[tdx] + 1,) + ranks[tdx+1:]
+            if (edx, successor) in self.seen[state]: continue
+            if self.kth(tail, successor[tdx] + 1):
+                self.seen[state].add((edx, successor))
+                heapq.heappush(self.candidates[state], (self.score(state, edge, successor),
+                                                        next(self.ties), edx, successor))
+
+    def children(self, state, derivation):
+        """
+        Returns the (state, derivation) pairs of the children of a node by
+        walking back along its incomplete states.
+        """
+        children = []
+        while derivation[2] is not None:
+            edge = self.edges[state][derivation[2]]
+            tail = edge[-1]
+            children.insert(0, (tail, self.derivs[tail][derivation[3][-1]]))
+            if len(edge) == 1: break
+            state, derivation = edge[0], self.derivs[edge[0]][derivation[3][0]]
+        return children
+
+    def expand(self, children):
+        tree = []
+        for state, derivation in children:
+            tree.append(state)
+            subtree = self.children(state, derivation)
+            if subtree:
+                tree.append(self.expand(subtree))
+        return tree
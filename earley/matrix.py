@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+# nlp.homework2.matrix
+
+"""
+A vectorized Earley recognizer that represents every chart column as a
+boolean matrix of origins by compiled dotted items. Prediction, scanning
+and completion are batched over all origins of a column at once as boolean
+matrix operations, so the per-item Python work of the EarleyParser is
+replaced by a handful of NumPy calls per column.
+
+The matrices are dense NumPy bool arrays rather than packed bitsets, one
+byte per flag, since the batched operations are matrix products that
+packed bits do not support. A chart takes (n+1) x (n+1) x items bytes for
+n words: the shipped grammar has 86 items, so 602 words take about 31 MB.
+
+Requires NumPy, which is otherwise not a dependency of this package.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from earley import EarleyParser, ParseError
+
+class MatrixParser(object):
+    """
+    Recognizes strings with the same Grammar and Lexicon as the EarleyParser
+    but without building DottedRule objects. It is not an EarleyParser: it
+    only borrows one for validation and tokenizing, and its parse returns
+    the chart and whether the string is grammatical rather than a
+    ParseResult. The chart is a list of (n+1) x items boolean matrices,
+    where chart[k][j, i] is set when item i spans [j, k]. Items are the
+    dotted rules of every production, numbered so the item after i (the
+    dot moved one symbol right) is always i + 1.
+
+    Epsilon productions are not supported (the grammar format cannot
+    express them anyway).
+    """
+
+    def __init__(self, grammar, lexicon, start="NP"):
+        if np is None:
+            raise ParseError("The MatrixParser requires NumPy to be installed.")
+
+        self.grammar = grammar
+        self.lexicon = lexicon
+        self.start   = start
+        self.parser  = EarleyParser(grammar, lexicon)
+        self.compile()
+
+    def compile(self):
+        """
+        Numbers the nonterminals and dotted items of the grammar and builds
+        the constant matrices used by the predictor, scanner and completer.
+        """
+        self.symbols = sorted(set(rule.lhs for rule in self.grammar.productions()))
+        self.symbolids = dict((sym, idx) for idx, sym in enumerate(self.symbols))
+
+        self.items = []     # (production, dot) for every item id
+        for production in self.grammar.productions():
+            for dot in xrange(len(production.rhs) + 1):
+                self.items.append((production, dot))
+
+        nsyms  = len(self.symbols)
+        nitems = len(self.items)
+
+        self.waits    = np.zeros((nsyms, nitems), dtype=bool)   # item waits for nonterminal
+        self.complete = np.zeros((nitems, nsyms), dtype=bool)   # item is a completed lhs
+        self.starts   = np.zeros((nsyms, nitems), dtype=bool)   # dot 0 items of an lhs
+        self.corners  = np.eye(nsyms, dtype=bool)               # lhs -> leftmost nonterminal
+        self.scans    = {}                                      # preterminal -> waiting items
+
+        for idx, (production, dot) in enumerate(self.items):
+            lhs = self.symbolids[production.lhs]
+            if dot == len(production.rhs):
+                self.complete[idx, lhs] = True
+                continue
+
+            nextcat = production.rhs[dot]
+            if nextcat in self.symbolids:
+                self.waits[self.symbolids[nextcat], idx] = True
+            else:
+                if nextcat not in self.scans:
+                    self.scans[nextcat] = np.zeros(nitems, dtype=bool)
+                self.scans[nextcat][idx] = True
+
+            if dot == 0:
+                self.starts[lhs, idx] = True
+                if nextcat in self.symbolids:
+                    self.corners[lhs, self.symbolids[nextcat]] = True
+
+        # Transitive closure of the left corner relation, so that predicting
+        # a nonterminal is a single row lookup instead of a worklist.
+        while True:
+            closure = self.corners | np.dot(self.corners, self.corners)
+            if (closure == self.corners).all(): break
+            self.corners = closure
+
+        self.predicts = np.dot(self.corners, self.starts)
+        self.accepts  = self.complete[:, self.symbolids[self.start]].copy()
+
+    def enqueue(self, length):
+        """
+        Returns an empty chart for a string of the given length with the
+        start symbol predicted in the first column.
+        """
+        chart = [np.zeros((length+1, len(self.items)), dtype=bool) for idx in xrange(length+1)]
+        chart[0][0] = self.predicts[self.symbolids[self.start]]
+        return chart
+
+    def parse(self, string):
+        """
+        Recognizes the string and returns the chart along with a boolean that
+        is True if the string is grammatical. The chart is not stored on the
+        parser.
+        """
+        words = self.parser.tokenize(string)
+        chart = self.enqueue(len(words))
+
+        for idx in xrange(0, len(words)+1):
+            if idx > 0:
+                self.completer(chart, idx)
+            self.predictor(chart, idx)
+            if idx < len(words):
+                self.scanner(chart, idx, words[idx][1])
+
+        return chart, bool((chart[-1][0] & self.accepts).any())
+
+    def predictor(self, chart, idx):
+        """
+        Predicts every nonterminal waited on by any item in the column.
+        """
+        column = chart[idx]
+        wanted = np.dot(column[:idx+1], self.waits.T).any(axis=0)
+        column[idx] |= np.dot(wanted, self.predicts)
+
+    def scanner(self, chart, idx, tag):
+        """
+        Advances all items of the column waiting on the preterminal tag into
+        the next column.
+        """
+        if tag not in self.scans: return
+
+        moved = chart[idx][:idx+1] & self.scans[tag]
+        chart[idx+1][:idx+1, 1:] |= moved[:, :-1]
+
+    def completer(self, chart, kdx):
+        """
+        Completes the column from the nearest origin outward. Every item
+        completed over [jdx, kdx] advances all items in column jdx waiting on
+        its lhs at once; unit chains that land back on origin jdx are handled
+        by repeating until no new lhs is completed.
+        """
+        column = chart[kdx]
+        for jdx in xrange(kdx-1, -1, -1):
+            done = np.zeros(len(self.symbols), dtype=bool)
+            while True:
+                found = np.dot(column[jdx], self.complete) & ~done
+                if not found.any(): break
+                done |= found
+
+                moved = chart[jdx][:jdx+1] & np.dot(found, self.waits)
+                column[:jdx+1, 1:] |= moved[:, :-1]
+
+    def states(self, chart, idx):
+        """
+        Yields the (production, dot, origin) items set in a chart column.
+        """
+        for jdx, item in zip(*np.nonzero(chart[idx])):
+            production, dot = self.items[item]
+            yield production, dot, jdx
+
+    def __str__(self):
+        return "MatrixParser: %i nonterminals, %i items" % (len(self.symbols), len(self.items))
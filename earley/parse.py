@@ -122,9 +122,11 @@ class ConsoleProgram(object):
         parser = get_default_parser(cfgpath, lexpath)
 
         try:
-            chart, parses = parser.parse(phrase)
+            result = parser.parse(phrase)
+            parses = result.parses
 
-            print parser
+            print "Parsing the sequence:\n%s" % result.words
+            print result
             print
 
             if len(parses) > 0:
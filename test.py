@@ -26,7 +26,7 @@ if __name__ == "__main__":
         parser = get_default_parser()
 
         for phrase in dev_phrases:
-            chart, parses = parser.parse(phrase)
+            parses = parser.parse(phrase).parses
 
             if len(parses) > 0:
                 print "%s:" % phrase